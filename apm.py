@@ -6,21 +6,166 @@ APM (Android Package Manager) - Command-line package manager for Android FOSS ap
 import os
 import sys
 import json
+import logging
+import mmap
 import subprocess
+import tempfile
 import click
 from pathlib import Path
 import yaml
 import requests
 import time
 import re
+import shlex
+import shutil
+import signal
+import stat
+import bisect
+import functools
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+# Prefer the libyaml-backed loader/dumper when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from packaging.version import parse as parse_version
+except ImportError:
+    parse_version = None
+
+logger = logging.getLogger(__name__)
+
+# User config and cache locations, expanded once at import
+CONFIG_DIR = os.path.expanduser("~/.config/apm")
+CONFIG_PATH = os.path.join(CONFIG_DIR, "config.yaml")
+MAPPINGS_PATH = os.path.join(CONFIG_DIR, "package_mappings.yaml")
+CACHE_DIR = os.path.expanduser("~/.cache/apm")
+CONFIG_CACHE_PATH = os.path.join(CACHE_DIR, "config.json")
+MAPPINGS_CACHE_PATH = os.path.join(CACHE_DIR, "package_mappings.json")
+ADB_CACHE_PATH = os.path.join(CACHE_DIR, "adb_path")
+
+class AdbShell:
+    """Long-lived 'adb shell' session - commands go in over stdin and output is read between markers"""
+    START = '__APM_BEGIN__'
+    SENTINEL = '__APM_DONE__'
+
+    def __init__(self, adb_path, device_id=None):
+        target = ['-s', device_id] if device_id else []
+        # Without shell_v2 (pre-Android 7) there's no -T and the device PTY echoes
+        # our input back - run() copes with that, but skip the PTY when we can
+        features = subprocess.run([adb_path] + target + ['features'], capture_output=True,
+                                  text=True, timeout=10).stdout
+        shell = ['shell', '-T'] if 'shell_v2' in features.split() else ['shell']
+        self.proc = subprocess.Popen([adb_path] + target + shell, stdin=subprocess.PIPE,
+                                     stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     text=True, bufsize=1)
+
+    @staticmethod
+    def echo_marker(marker):
+        """Command printing marker - split by empty quotes so an echo of the input never contains it"""
+        return f'echo {marker[:6]}""{marker[6:]}'
+
+    def run(self, command):
+        """Run a shell command and return its stripped output, or None if the session has died"""
+        try:
+            self.proc.stdin.write(f"{self.echo_marker(self.START)}; {command}; {self.echo_marker(self.SENTINEL)}\n")
+            self.proc.stdin.flush()
+            lines = None
+            for line in self.proc.stdout:
+                line = line.rstrip('\r\n')
+                if lines is None:
+                    # Skip any echoed input and prompt until our command starts
+                    if line.endswith(self.START):
+                        lines = []
+                    continue
+                # Output without a trailing newline ends up on the sentinel line
+                if line.endswith(self.SENTINEL):
+                    lines.append(line[:-len(self.SENTINEL)])
+                    return '\n'.join(lines).strip()
+                lines.append(line)
+        except (BrokenPipeError, OSError, ValueError):
+            pass
+        return None
+
+    def close(self):
+        try:
+            self.proc.stdin.write("exit\n")
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (BrokenPipeError, OSError, ValueError, subprocess.TimeoutExpired):
+            self.proc.kill()
+
 class AndroidPackageManager:
+    # Serial of each fully connected device in 'adb devices' output - the
+    # header line and offline/unauthorized devices don't match
+    DEVICE_RE = re.compile(r'^(\S+)\tdevice$', re.M)
+
     def __init__(self, config_path="config.yaml"):
-        self.config = self.load_config(config_path)
-        self.mappings = self.load_mappings()
+        # Config and mappings are read on first use - see the properties below
+        self.config_path = config_path
+        # Per-instance memo of name resolution keyed on the raw name - resolution
+        # messages are only echoed on a miss; cleared whenever mappings are reloaded
+        self.resolve_package_name = functools.lru_cache(maxsize=4096)(self._resolve_package_name)
+        self._mappings = None
+        self._raw_mappings = None
         self.repo_cache = {}
-        self.adb_path = self.find_adb()
+        self.devices_cache = None
+        self.debug = False
+
+    @functools.cached_property
+    def config(self):
+        """Load the config on first use so mapping-only commands never parse it"""
+        return self.load_config(self.config_path)
+
+    @property
+    def mappings(self):
+        self.ensure_mappings()
+        return self._mappings
+
+    @mappings.setter
+    def mappings(self, value):
+        """Replace mappings and drop everything derived from the previous ones"""
+        self._mappings = value
+        # Lowercase each name once here rather than on every lookup
+        self._keys_lower = tuple((name.lower(), name) for name in value)
+        self._trigram_index = None
+        self._joined_names = None
+        self.resolve_package_name.cache_clear()
+
+    @property
+    def raw_mappings(self):
+        """Nested mappings as stored in the YAML file"""
+        self.ensure_mappings()
+        if self._raw_mappings is None:
+            # Only the flat view is cached, and a file that failed to parse is left
+            # unset - parse it here so an edit never starts from (and saves) nothing.
+            # Parse errors propagate rather than being treated as an empty file
+            raw_mappings = read_yaml(MAPPINGS_PATH) or {}
+            if not isinstance(raw_mappings, dict):
+                raise yaml.YAMLError(f"{MAPPINGS_PATH} does not contain a mapping of categories")
+            self._raw_mappings = raw_mappings
+        return self._raw_mappings
+
+    def ensure_mappings(self):
+        """Load the mappings file on first use so device-only commands never parse it"""
+        if self._mappings is None:
+            self.mappings = self.load_mappings()
+
+    @functools.cached_property
+    def adb_path(self):
+        """Locate adb on first use so commands that never touch a device skip the lookup"""
+        return self.find_adb()
 
     def get_installed_packages(self, device_id=None):
         """Get list of installed packages on device"""
@@ -43,25 +188,27 @@ class AndroidPackageManager:
         
         return packages
 
-    def get_package_version(self, package_name, device_id=None):
-        """Get installed version of a package on device"""
+    def get_package_version(self, package_name, device_id=None, shell=None):
+        """Get installed version of a package on device, via an open AdbShell session if given"""
         if not self.adb_path:
             return None
         
-        cmd = ['shell', 'dumpsys', 'package', package_name]
-        if device_id:
-            cmd = ['-s', device_id] + cmd
+        # Filter on the device so only the versionName line crosses the wire,
+        # not the full (often hundreds of KB) dumpsys report
+        command = f"dumpsys package {shlex.quote(package_name)} | grep -m1 versionName= || true"
         
-        output = self.run_adb_command(cmd)
-        if not output:
-            return None
+        output = shell.run(command) if shell else None
+        if output is None:
+            cmd = ['shell', command]
+            if device_id:
+                cmd = ['-s', device_id] + cmd
+            output = self.run_adb_command(cmd)
         
-        for line in output.split('\n'):
-            if 'versionName=' in line:
-                version = line.split('versionName=')[1].split()[0]
-                return version.strip()
+        if not output or 'versionName=' not in output:
+            return None
         
-        return None
+        version = output.split('versionName=', 1)[1].split()
+        return version[0].strip() if version else None
 
     def parse_latest_version_from_fdroidcl(self, output):
         """Parse version from fdroidcl show output with strict validation"""
@@ -160,6 +307,15 @@ class AndroidPackageManager:
 
     def compare_versions_semantic(self, latest, current):
         """Improved semantic version comparison"""
+        # Fast path for plain numeric versions like 1.2.3 - no regex or dict work needed
+        latest_fields = latest.split('.')
+        current_fields = current.split('.')
+        if all(field.isdecimal() for field in latest_fields) and all(field.isdecimal() for field in current_fields):
+            width = max(len(latest_fields), len(current_fields))
+            latest_nums = [int(field) for field in latest_fields] + [0] * (width - len(latest_fields))
+            current_nums = [int(field) for field in current_fields] + [0] * (width - len(current_fields))
+            return latest_nums > current_nums
+
         try:
             # Normalize versions for comparison
             latest_norm = self.normalize_version(latest)
@@ -200,12 +356,18 @@ class AndroidPackageManager:
         if not self.is_valid_version(latest) or not self.is_valid_version(current):
             return False
         
+        # A differing numeric major version settles it without full parsing
+        latest_major = latest.split('.', 1)[0]
+        current_major = current.split('.', 1)[0]
+        if latest_major != current_major and latest_major.isdecimal() and current_major.isdecimal():
+            return int(latest_major) > int(current_major)
+        
+        if parse_version is None:
+            return self.compare_versions_semantic(latest, current)
+        
         try:
             # Try semantic versioning first
-            from packaging import version
-            return version.parse(latest) > version.parse(current)
-        except ImportError:
-            return self.compare_versions_semantic(latest, current)
+            return parse_version(latest) > parse_version(current)
         except Exception as e:
             # If parsing fails, be conservative
             return False
@@ -235,9 +397,10 @@ class AndroidPackageManager:
             # If we can't parse versions properly, flag as questionable
             return True
 
-    def get_available_updates(self, device_id=None):
+    def get_available_updates(self, device_id=None, installed_packages=None):
         """Enhanced version with validation and debugging"""
-        installed_packages = self.get_installed_packages(device_id)
+        if installed_packages is None:
+            installed_packages = self.get_installed_packages(device_id)
         updates_available = []
         questionable_updates = []
         
@@ -251,63 +414,66 @@ class AndroidPackageManager:
         not_in_repos = 0
         parsing_errors = 0
         
+        # One adb shell session serves every version query instead of an adb process per package
+        shell = self.open_adb_shell(device_id)
+        
         try:
-            for i, package in enumerate(installed_packages):
-                # Show progress
-                if i % 5 == 0 or i == len(installed_packages) - 1:
-                    progress = (i + 1) / len(installed_packages) * 100
-                    click.echo(f"\r   📊 Progress: {progress:.1f}% ({i+1}/{len(installed_packages)}) - Found {len(updates_available)} updates", nl=False)
-                
-                # Get current version from device
-                current_version = self.get_package_version(package, device_id)
-                if not current_version:
-                    continue
-                
-                try:
-                    result = subprocess.run(['fdroidcl', 'show', package], 
-                                        capture_output=True, text=True, timeout=15)
-                    
-                    if result.returncode != 0:
-                        not_in_repos += 1
+            with click.progressbar(installed_packages, label='   📊 Checking updates') as bar:
+                for package in bar:
+                    # Get current version from device
+                    current_version = self.get_package_version(package, device_id, shell=shell)
+                    if not current_version:
                         continue
                     
-                    # Parse version with validation
-                    latest_version = self.parse_latest_version_from_fdroidcl(result.stdout)
-                    
-                    if not latest_version:
-                        parsing_errors += 1
+                    try:
+                        result = subprocess.run(['fdroidcl', 'show', package], 
+                                            capture_output=True, text=True, timeout=15)
+                        
+                        if result.returncode != 0:
+                            not_in_repos += 1
+                            continue
+                        
+                        # Parse version with validation
+                        latest_version = self.parse_latest_version_from_fdroidcl(result.stdout)
+                        
+                        if not latest_version:
+                            parsing_errors += 1
+                            continue
+                        
+                        # Validate both versions
+                        if not self.is_valid_version(current_version) or not self.is_valid_version(latest_version):
+                            continue
+                        
+                        # Check if update looks reasonable
+                        if self.is_version_newer(latest_version, current_version):
+                            update_info = {
+                                'package': package,
+                                'current_version': current_version,
+                                'latest_version': latest_version
+                            }
+                            
+                            # Flag questionable updates for review
+                            if self.is_questionable_update(current_version, latest_version):
+                                questionable_updates.append(update_info)
+                                if self.debug:
+                                    click.echo(f"\n   🤔 Questionable: {package} {current_version} → {latest_version}")
+                            else:
+                                updates_available.append(update_info)
+                                if self.debug and len(updates_available) <= 3:
+                                    click.echo(f"\n   ✅ Valid update: {package} {current_version} → {latest_version}")
+                        
+                    except subprocess.TimeoutExpired:
                         continue
-                    
-                    # Validate both versions
-                    if not self.is_valid_version(current_version) or not self.is_valid_version(latest_version):
+                    except Exception as e:
                         continue
                     
-                    # Check if update looks reasonable
-                    if self.is_version_newer(latest_version, current_version):
-                        update_info = {
-                            'package': package,
-                            'current_version': current_version,
-                            'latest_version': latest_version
-                        }
-                        
-                        # Flag questionable updates for review
-                        if self.is_questionable_update(current_version, latest_version):
-                            questionable_updates.append(update_info)
-                            click.echo(f"\n   🤔 Questionable: {package} {current_version} → {latest_version}")
-                        else:
-                            updates_available.append(update_info)
-                            if len(updates_available) <= 3:
-                                click.echo(f"\n   ✅ Valid update: {package} {current_version} → {latest_version}")
-                    
-                except subprocess.TimeoutExpired:
-                    continue
-                except Exception as e:
-                    continue
-                
-                check_count += 1
-        
+                    check_count += 1
+            
         except KeyboardInterrupt:
             click.echo(f"\n⚠️  Update check interrupted")
+        finally:
+            if shell:
+                shell.close()
         
         # Clear progress line
         click.echo(f"\r   📊 Update check completed: {check_count} checked, {not_in_repos} not in repos, {parsing_errors} parsing errors")
@@ -342,12 +508,13 @@ class AndroidPackageManager:
             
         except Exception as e:
             click.echo(f"⚠️  Could not enumerate installed packages: {e}")
+            installed_packages = None
             total_installed = 0
         
         # Check for available updates with better error handling
         try:
             click.echo("\n🔍 Detailed update analysis:")
-            updates = self.get_available_updates(device_id)
+            updates = self.get_available_updates(device_id, installed_packages=installed_packages)
             update_check_time = time.time() - start_time
             click.echo(f"⏱️  Update check completed in {update_check_time:.1f}s")
         except Exception as e:
@@ -416,6 +583,8 @@ class AndroidPackageManager:
         success_count = 0
         failed_packages = []
         
+        env = self.device_env(device_id)
+        
         for i, update in enumerate(updates, 1):
             package = update['package']
             current_ver = update['current_version']
@@ -426,27 +595,26 @@ class AndroidPackageManager:
             click.echo(f"\n{progress} 🔄 Updating {package}...")
             click.echo(f"      📤 {current_ver} → 📥 {latest_ver}")
             
-            if device_id:
-                os.environ['ANDROID_SERIAL'] = device_id
-            
             package_start_time = time.time()
             
             try:
-                # Run update with timeout
-                result = subprocess.run(['fdroidcl', 'install', package], 
-                                    check=True, capture_output=True, text=True, timeout=120)
+                # Run update with timeout, streaming output instead of buffering it all
+                self.run_streaming(['fdroidcl', 'install', package], timeout=120, env=env)
                 
                 package_time = time.time() - package_start_time
-                click.echo(f"      ✅ Updated in {package_time:.1f}s")
+                click.echo(f"\r      ✅ Updated in {package_time:.1f}s")
                 success_count += 1
                 
             except subprocess.TimeoutExpired:
-                click.echo(f"      ⏰ Timeout after 2 minutes")
+                click.echo(f"\r      ⏰ Timeout after 2 minutes")
                 failed_packages.append({'package': package, 'reason': 'timeout'})
                 
             except subprocess.CalledProcessError as e:
-                error_msg = e.stderr.strip() if e.stderr else str(e)
-                click.echo(f"      ❌ Failed: {error_msg}")
+                error_lines = e.output.splitlines() if e.output else []
+                error_msg = error_lines[-1].strip() if error_lines else str(e)
+                click.echo(f"\r      ❌ Failed: {error_msg}")
+                for line in error_lines[:-1]:
+                    click.echo(f"         {line}")
                 failed_packages.append({'package': package, 'reason': error_msg})
             
             # Show progress bar
@@ -497,18 +665,77 @@ class AndroidPackageManager:
         
         return success_count > 0
 
-    def test_repository_connectivity(self, repo_url):
-        """Test if a repository is reachable"""
+    def run_streaming(self, cmd, timeout, tail_lines=50, env=None):
+        """Run a command while streaming its output, keeping only the last lines for error reporting"""
+        # Own process group, so a timeout also takes down grandchildren (e.g. the
+        # adb fdroidcl spawns) that would otherwise keep the pipe open
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, env=env, start_new_session=True)
+        timed_out = threading.Event()
+        
+        def kill_group():
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except AttributeError:
+                proc.kill()  # No process groups on Windows
+            except ProcessLookupError:
+                pass
+        
+        def kill():
+            timed_out.set()
+            kill_group()
+        
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+        tail = deque(maxlen=tail_lines)
+        spinner = '|/-\\'
+        try:
+            for count, line in enumerate(proc.stdout):
+                tail.append(line.rstrip())
+                click.echo(f"\r      {spinner[count % len(spinner)]} ", nl=False)
+            returncode = proc.wait()
+        except BaseException:
+            # Ctrl-C doesn't reach a separate session - don't leave it running
+            kill_group()
+            proc.wait()
+            raise
+        finally:
+            timer.cancel()
+            proc.stdout.close()
+        
+        if timed_out.is_set():
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output='\n'.join(tail))
+
+    def test_repository_connectivity(self, repo_url, ttl=60):
+        """Test if a repository is reachable - results are reused for ttl seconds"""
+        cached = self.repo_cache.get(repo_url)
+        if cached and time.monotonic() - cached[1] < ttl:
+            return cached[0]
+        
         try:
             from urllib.parse import urljoin
             # Test the index file specifically
             index_url = urljoin(repo_url+"/repo", 'index-v1.jar')
             
             response = requests.head(index_url, timeout=10, allow_redirects=True)
-            return response.status_code in [200, 304]  # 304 = Not Modified (cached)
+            reachable = response.status_code in [200, 304]  # 304 = Not Modified (cached)
             
         except requests.exceptions.RequestException:
-            return False
+            reachable = False
+        
+        self.repo_cache[repo_url] = (reachable, time.monotonic())
+        return reachable
+    
+    def test_repositories_connectivity(self, repositories):
+        """Probe several repositories concurrently - returns {url: reachable}"""
+        urls = list(dict.fromkeys(repo['url'] for repo in repositories))
+        if not urls:
+            return {}
+        
+        with ThreadPoolExecutor(max_workers=min(16, len(urls))) as executor:
+            return dict(zip(urls, executor.map(self.test_repository_connectivity, urls)))
 
     def get_enabled_repositories(self):
         """Get list of enabled repositories from config"""
@@ -534,13 +761,14 @@ class AndroidPackageManager:
         working_repos = []
         failed_repos = []
         
+        click.echo(f"Testing connectivity of {len(repositories)} repositories...")
+        reachable = self.test_repositories_connectivity(repositories)
+        
         for repo in repositories:
             repo_name = repo['name']
             repo_url = repo['url']
             
-            click.echo(f"Testing {repo_name} connectivity...")
-            
-            if self.test_repository_connectivity(repo_url):
+            if reachable[repo_url]:
                 click.echo(f"✓ {repo_name} is reachable")
                 working_repos.append(repo)
             else:
@@ -646,22 +874,36 @@ class AndroidPackageManager:
         except:
             return device_id
 
-    def load_config(self, path):
-        """Load configuration from YAML file - NO DEFAULTS"""
-        # Check different config locations
-        config_locations = [
+    def config_locations(self, path):
+        """Config files to try, in order"""
+        return [
             path,
-            os.path.expanduser("~/.config/apm/config.yaml"),
+            CONFIG_PATH,
             "./config.yaml"
         ]
+    
+    def has_config(self):
+        """Whether a config is loaded or there is a file to load it from"""
+        return 'config' in self.__dict__ or any(os.path.exists(p) for p in self.config_locations(self.config_path))
+    
+    def load_config(self, path):
+        """Load configuration from YAML file - NO DEFAULTS"""
+        # Check different config locations
+        config_locations = self.config_locations(path)
         
         for config_path in config_locations:
             if os.path.exists(config_path):
                 try:
-                    with open(config_path, 'r') as f:
-                        config = yaml.safe_load(f)
-                        if config:
-                            return config
+                    # Reuse the parsed config from the last run if this file is unchanged
+                    source = [os.path.abspath(config_path), os.stat(config_path).st_mtime_ns]
+                    config = self.load_cache(CONFIG_CACHE_PATH, source)
+                    if config:
+                        return config
+                    
+                    config = read_yaml(config_path)
+                    if config:
+                        self.save_cache(CONFIG_CACHE_PATH, source, config)
+                        return config
                 except Exception as e:
                     click.echo(f"Error loading config from {config_path}: {e}")
                     continue
@@ -675,28 +917,31 @@ class AndroidPackageManager:
         sys.exit(1)
     
     def load_mappings(self):
-        """Load package name mappings"""
-        mappings_path = os.path.expanduser("~/.config/apm/package_mappings.yaml")
+        """Load package name mappings - keeps the nested file contents in self._raw_mappings
+        when they were parsed (None when served from the cache or the file is unreadable)"""
+        self._raw_mappings = None
         
-        if os.path.exists(mappings_path):
+        if os.path.exists(MAPPINGS_PATH):
             try:
-                with open(mappings_path, 'r') as f:
-                    raw_mappings = yaml.safe_load(f)
+                # Reuse the parsed mappings from the last run if the YAML is unchanged
+                # The raw YAML isn't cached: JSON can't keep non-string keys such as
+                # a bare 2048:, which would be rewritten as strings on the next save
+                source = [MAPPINGS_PATH, os.stat(MAPPINGS_PATH).st_mtime_ns]
+                cached = self.load_cache(MAPPINGS_CACHE_PATH, source)
+                if cached is not None:
+                    self._raw_mappings = None
+                    return cached
+                
+                raw_mappings = read_yaml(MAPPINGS_PATH)
                 
                 if not raw_mappings:
                     click.echo("Warning: Package mappings file is empty")
+                    self._raw_mappings = {}
                     return {}
                 
-                # Flatten nested mappings
-                flat_mappings = {}
-                for category, packages in raw_mappings.items():
-                    if isinstance(packages, dict):
-                        for pkg_name, pkg_info in packages.items():
-                            if isinstance(pkg_name, str):  # Only process string keys
-                                flat_mappings[pkg_name] = pkg_info
-                    elif isinstance(category, str):
-                        flat_mappings[category] = packages
-                
+                flat_mappings = self.flatten_mappings(raw_mappings)
+                self._raw_mappings = raw_mappings
+                self.save_cache(MAPPINGS_CACHE_PATH, source, flat_mappings)
                 return flat_mappings
                 
             except yaml.YAMLError as e:
@@ -706,12 +951,101 @@ class AndroidPackageManager:
                 click.echo(f"Error loading mappings: {e}")
                 return {}
         else:
+            # Nothing to lose - add-mapping may start a new file
+            self._raw_mappings = {}
             click.echo("❌ Package mappings file not found!")
-            click.echo(f"Expected location: {mappings_path}")
+            click.echo(f"Expected location: {MAPPINGS_PATH}")
             click.echo("Please run the installation script first.")
             return {}
     
-    def resolve_package_name(self, package_name):
+    def flatten_mappings(self, raw_mappings):
+        """Flatten nested mappings - categories contribute their entries,
+        top-level scalars map directly. Keys are coerced to strings."""
+        return {
+            str(pkg_name): pkg_info
+            for category, packages in raw_mappings.items()
+            for pkg_name, pkg_info in (packages.items() if isinstance(packages, dict) else [(category, packages)])
+        }
+    
+    def save_mappings(self):
+        """Write self.raw_mappings back to the YAML file and refresh the cache to match"""
+        write_yaml_atomic(MAPPINGS_PATH, self.raw_mappings)
+        self.save_cache(MAPPINGS_CACHE_PATH, [MAPPINGS_PATH, os.stat(MAPPINGS_PATH).st_mtime_ns],
+                        self.mappings)
+    
+    def add_mapping(self, friendly_name, package_id):
+        """Add or update a mapping and save - returns False if it already exists.
+        A name already in the file is changed where it is; new names go to the custom category"""
+        # Names are compared as strings, like flatten_mappings does - a bare 2048:
+        # in the file is the same name as '2048' on the command line
+        if self.mappings.get(friendly_name) == package_id:
+            return False
+        
+        # The last entry with this name is the one flatten_mappings lets win
+        target = None
+        for category, packages in self.raw_mappings.items():
+            if isinstance(packages, dict):
+                for key in packages:
+                    if str(key) == friendly_name:
+                        target = (packages, key)
+            elif str(category) == friendly_name:
+                target = (self.raw_mappings, category)
+        
+        if target is None:
+            target = (self.raw_mappings.setdefault("custom", {}), friendly_name)
+        packages, key = target
+        packages[key] = package_id
+        
+        # Update the in-memory view and save - no need to re-read the file
+        self.mappings = self.flatten_mappings(self.raw_mappings)
+        self.save_mappings()
+        return True
+    
+    def remove_mapping(self, friendly_name):
+        """Remove a mapping from the first category holding it and save - returns False if not found"""
+        for packages in self.raw_mappings.values():
+            if not isinstance(packages, dict):
+                continue
+            # Match names as strings, like flatten_mappings - 2048: is '2048'
+            keys = [key for key in packages if str(key) == friendly_name]
+            if keys:
+                for key in keys:
+                    del packages[key]
+                break
+        else:
+            return False
+        
+        # Update the in-memory view and save - no need to re-read the file
+        self.mappings = self.flatten_mappings(self.raw_mappings)
+        self.save_mappings()
+        return True
+    
+    def load_cache(self, cache_path, source):
+        """Load cached parsed data if it was saved for the same source (path/mtime)"""
+        try:
+            with open(cache_path, 'rb') as f:
+                data = f.read()
+            cached = orjson.loads(data) if orjson else json.loads(data)
+            if cached.get('source') == source:
+                return cached['data']
+        except Exception:
+            pass
+        return None
+    
+    def save_cache(self, cache_path, source, data):
+        """Save parsed data tagged with its source (path/mtime) - failures are non-fatal"""
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            cached = {'source': source, 'data': data}
+            encoded = orjson.dumps(cached) if orjson else json.dumps(cached).encode()
+            # Write beside the target and rename over it so a concurrent run never reads a partial file
+            with tempfile.NamedTemporaryFile('wb', dir=os.path.dirname(cache_path), delete=False) as f:
+                f.write(encoded)
+            os.replace(f.name, cache_path)
+        except Exception:
+            pass
+    
+    def _resolve_package_name(self, package_name):
         """Resolve friendly name to actual package ID"""
         # Check if it's already a package ID (contains dots)
         if '.' in package_name:
@@ -729,18 +1063,14 @@ class AndroidPackageManager:
             if isinstance(resolved, dict):
                 package_id = resolved.get('package_id', resolved.get('id', ''))
                 if package_id:
-                    click.echo(f"Resolved '{package_name}' -> '{package_id}'")
+                    logger.info("Resolved '%s' -> '%s'", package_name, package_id)
                     return package_id
             else:
-                click.echo(f"Resolved '{package_name}' -> '{resolved}'")
+                logger.info("Resolved '%s' -> '%s'", package_name, resolved)
                 return resolved
         
-        # Check for partial matches - only check string keys
-        matches = []
-        for name in self.mappings.keys():
-            if isinstance(name, str) and isinstance(package_name, str):
-                if package_name.lower() in name.lower():
-                    matches.append(name)
+        # Check for partial matches
+        matches = self.find_partial_matches(package_name)
         
         if len(matches) == 1:
             resolved_name = matches[0]
@@ -750,10 +1080,10 @@ class AndroidPackageManager:
             if isinstance(resolved_value, dict):
                 package_id = resolved_value.get('package_id', resolved_value.get('id', ''))
                 if package_id:
-                    click.echo(f"Resolved '{package_name}' -> '{resolved_name}' -> '{package_id}'")
+                    logger.info("Resolved '%s' -> '%s' -> '%s'", package_name, resolved_name, package_id)
                     return package_id
             else:
-                click.echo(f"Resolved '{package_name}' -> '{resolved_name}' -> '{resolved_value}'")
+                logger.info("Resolved '%s' -> '%s' -> '%s'", package_name, resolved_name, resolved_value)
                 return resolved_value
                 
         elif len(matches) > 1:
@@ -770,16 +1100,101 @@ class AndroidPackageManager:
             return None
         
         # If no mapping found, return original name
-        click.echo(f"No mapping found for '{package_name}', using as-is")
+        logger.info("No mapping found for '%s', using as-is", package_name)
         return package_name
     
-    def find_adb(self):
-        """Find ADB executable in PATH"""
+    def build_trigram_index(self):
+        """Map every 3-character substring of the lowercased mapping names to the names containing it"""
+        index = {}
+        for lowered, name in self._keys_lower:
+            for trigram in dict.fromkeys(lowered[i:i + 3] for i in range(len(lowered) - 2)):
+                index.setdefault(trigram, []).append((lowered, name))
+        return index
+    
+    def build_joined_names(self):
+        """Join the lowercased names into one separator-delimited string plus each name's start offset"""
+        offsets = []
+        position = 0
+        for lowered, name in self._keys_lower:
+            offsets.append(position)
+            position += len(lowered) + 1
+        joined = '\x1f'.join(lowered for lowered, name in self._keys_lower) + '\x1f'
+        return joined, offsets
+    
+    def scan_joined_names(self, query):
+        """Find names containing query with str.find over the joined names string"""
+        if self._joined_names is None:
+            self._joined_names = self.build_joined_names()
+        joined, offsets = self._joined_names
+        
+        matches = []
+        position = joined.find(query)
+        while position != -1:
+            index = bisect.bisect_right(offsets, position) - 1
+            matches.append(self._keys_lower[index][1])
+            # Resume at the next name so each name is reported once
+            if index + 1 == len(offsets):
+                break
+            position = joined.find(query, offsets[index + 1])
+        return matches
+    
+    def find_partial_matches(self, query):
+        """Find mapping names containing query (case-insensitive), in mapping order"""
+        if not isinstance(query, str):
+            return []
+        
+        self.ensure_mappings()
+        query = query.lower()
+        if len(query) < 2 or '\x1f' in query:
+            # Matches most names - a plain pass beats per-hit find/bisect
+            return [name for lowered, name in self._keys_lower if query in lowered]
+        if len(query) < 3:
+            # Too short to use the index - scan all names in one string search
+            return self.scan_joined_names(query)
+        
+        if self._trigram_index is None:
+            self._trigram_index = self.build_trigram_index()
+        
+        # Every match contains all of the query's trigrams, so the shortest
+        # posting list is a complete candidate set - verify each candidate
+        postings = [self._trigram_index.get(query[i:i + 3], []) for i in range(len(query) - 2)]
+        candidates = min(postings, key=len)
+        return [name for lowered, name in candidates if query in lowered]
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def find_adb():
+        """Find ADB executable - resolved once per process and cached on disk across runs"""
+        # Reuse the location found by a previous run while it is still executable
+        try:
+            with open(ADB_CACHE_PATH, 'r') as f:
+                cached_path = f.read().strip()
+            if cached_path and os.access(cached_path, os.X_OK):
+                return cached_path
+        except OSError:
+            pass
+        
+        adb_path = AndroidPackageManager.search_adb()
+        if not adb_path:
+            # If not found, warn user but don't fail
+            click.echo("Warning: ADB not found in PATH. Install Android SDK platform-tools.")
+            return None
+        
+        try:
+            os.makedirs(os.path.dirname(ADB_CACHE_PATH), exist_ok=True)
+            with open(ADB_CACHE_PATH, 'w') as f:
+                f.write(adb_path)
+        except OSError:
+            pass
+        return adb_path
+    
+    @staticmethod
+    def search_adb():
+        """Search PATH and common SDK locations for the ADB executable"""
         # Check if adb is in PATH
-        for path in os.environ.get('PATH', '').split(os.pathsep):
-            adb_path = os.path.join(path, 'adb')
-            if os.path.isfile(adb_path) and os.access(adb_path, os.X_OK):
-                return adb_path
+        adb_path = shutil.which('adb')
+        if adb_path:
+            return adb_path
         
         # Try common locations
         common_paths = [
@@ -791,13 +1206,25 @@ class AndroidPackageManager:
         ]
         
         for path in common_paths:
-            if os.path.isfile(path) and os.access(path, os.X_OK):
+            # One stat call covers both the regular-file and executable-bit checks
+            try:
+                mode = os.stat(path).st_mode
+            except OSError:
+                continue
+            if stat.S_ISREG(mode) and mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
                 return path
         
-        # If not found, warn user but don't fail
-        click.echo("Warning: ADB not found in PATH. Install Android SDK platform-tools.")
         return None
     
+    def open_adb_shell(self, device_id=None):
+        """Start a persistent AdbShell session, or None if adb can't be launched"""
+        if not self.adb_path:
+            return None
+        try:
+            return AdbShell(self.adb_path, device_id)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+    
     def run_adb_command(self, command, capture_output=True):
         """Execute ADB command"""
         if not self.adb_path:
@@ -812,22 +1239,21 @@ class AndroidPackageManager:
             click.echo(f"ADB command failed: {e}")
             return None
     
-    def get_connected_devices(self):
-        """Get list of connected Android devices"""
+    def get_connected_devices(self, ttl=1.0):
+        """Get list of connected Android devices - repeated calls within ttl seconds reuse the last answer"""
         if not self.adb_path:
             return []
+        
+        if self.devices_cache and time.monotonic() - self.devices_cache[1] < ttl:
+            return list(self.devices_cache[0])
             
         output = self.run_adb_command(['devices'])
         if not output:
             return []
         
-        devices = []
-        for line in output.split('\n')[1:]:
-            if line.strip() and 'device' in line:
-                device_id = line.split('\t')[0]
-                devices.append(device_id)
-        
-        return devices
+        devices = self.DEVICE_RE.findall(output)
+        self.devices_cache = (devices, time.monotonic())
+        return list(devices)
     
     def search_packages(self, query=None, category=None):
         """Search for packages in repositories"""
@@ -844,6 +1270,14 @@ class AndroidPackageManager:
             click.echo("fdroidcl not found. Please install it first.")
             return None
     
+    def device_env(self, device_id):
+        """Environment for fdroidcl targeting device_id - None inherits ours unchanged"""
+        # Passed per process rather than set in os.environ, which would leak
+        # into every later command and is shared between threads
+        if not device_id:
+            return None
+        return {**os.environ, 'ANDROID_SERIAL': device_id}
+    
     def install_package(self, package_name, device_id=None):
         """Install package with name resolution"""
         package_id = self.resolve_package_name(package_name)
@@ -852,11 +1286,8 @@ class AndroidPackageManager:
             click.echo(f"Could not resolve package name: {package_name}")
             return False
         
-        if device_id:
-            os.environ['ANDROID_SERIAL'] = device_id
-        
         try:
-            subprocess.run(['fdroidcl', 'install', package_id], check=True)
+            subprocess.run(['fdroidcl', 'install', package_id], check=True, env=self.device_env(device_id))
             click.echo(f"Successfully installed {package_id}")
             return True
         except subprocess.CalledProcessError:
@@ -866,31 +1297,142 @@ class AndroidPackageManager:
             click.echo("fdroidcl not found. Please install it first.")
             return False
     
-    def batch_install(self, package_list_file, device_id=None):
-        """Install multiple packages from file"""
+    def read_package_list(self, package_list_file):
+        """Read non-empty, stripped lines from a package list file"""
+        with open(package_list_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            # mmap setup isn't worth it for typical small lists
+            if size < 64 * 1024:
+                lines = f.read().splitlines()
+            else:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    lines = []
+                    start = 0
+                    while start < size:
+                        end = mm.find(b'\n', start)
+                        if end == -1:
+                            end = size
+                        lines.append(mm[start:end])
+                        start = end + 1
+        
+        return [line.decode().strip() for line in lines if line.strip()]
+    
+    def batch_install(self, package_list_file, device_id=None, sequential=False):
+        """Install multiple packages from file - in one fdroidcl run unless sequential"""
         try:
-            with open(package_list_file, 'r') as f:
-                packages = [line.strip() for line in f if line.strip()]
-            
-            for package in packages:
-                click.echo(f"Installing {package}...")
-                self.install_package(package, device_id)
-                
+            # Drop repeated lines, keeping first-seen order
+            packages = list(dict.fromkeys(self.read_package_list(package_list_file)))
         except FileNotFoundError:
             click.echo(f"Package list file not found: {package_list_file}")
+            return
+        
+        # Resolve every name first so fdroidcl can install them all in one run
+        package_ids = []
+        for package in packages:
+            package_id = self.resolve_package_name(package)
+            if package_id:
+                package_ids.append(package_id)
+            else:
+                click.echo(f"Could not resolve package name: {package}")
+        
+        # Different names (alias and raw ID, say) may resolve to the same package
+        package_ids = list(dict.fromkeys(package_ids))
+        
+        if not package_ids:
+            click.echo("No packages to install")
+            return
+        
+        if sequential:
+            # One fdroidcl run per package so each failure is reported on its own
+            for package_id in package_ids:
+                click.echo(f"Installing {package_id}...")
+                self.install_package(package_id, device_id)
+            return
+        
+        env = self.device_env(device_id)
+        
+        click.echo(f"Installing {len(package_ids)} packages...")
+        try:
+            result = subprocess.run(['fdroidcl', 'install', *package_ids], check=False, env=env)
+        except FileNotFoundError:
+            click.echo("fdroidcl not found. Please install it first.")
+            return
+        
+        if result.returncode == 0:
+            click.echo(f"Successfully installed {len(package_ids)} packages")
+            return
+        
+        # fdroidcl aborts on the first failing package - retry each one separately so
+        # a single bad ID doesn't block the rest (already installed ones are no-ops)
+        click.echo("⚠️  Batch install failed, retrying packages individually...")
+        # The bulk run needs no config - a missing one shouldn't abort the retries
+        updates = self.config.get('updates', {}) if self.has_config() else {}
+        max_workers = max(1, updates.get('max_concurrent_updates', 3))
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(package_ids))) as executor:
+            futures = {
+                executor.submit(subprocess.run, ['fdroidcl', 'install', package_id],
+                                capture_output=True, text=True, env=env): package_id
+                for package_id in package_ids
+            }
+            for future in as_completed(futures):
+                package_id = futures[future]
+                result = future.result()
+                if result.returncode == 0:
+                    click.echo(f"Successfully installed {package_id}")
+                else:
+                    error_msg = result.stderr.strip() or result.stdout.strip()
+                    click.echo(f"Failed to install {package_id}: {error_msg}")
+
+def read_yaml(path):
+    """Parse a YAML file, mapping it into memory instead of copying when it is large"""
+    with open(path, 'rb') as f:
+        # mmap setup isn't worth it for typical small configs
+        if os.fstat(f.fileno()).st_size < 64 * 1024:
+            return yaml.load(f, Loader=SafeLoader)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            return yaml.load(mm, Loader=SafeLoader)
+
+def write_yaml_atomic(path, data):
+    """Dump data to a temp file beside path, flush it to disk, then rename it over path"""
+    directory = os.path.dirname(path) or '.'
+    with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as f:
+        try:
+            yaml.dump(data, f, Dumper=SafeDumper, default_flow_style=False)
+            f.flush()
+            os.fsync(f.fileno())
+            # NamedTemporaryFile is created 0600 - keep the permissions of the file we
+            # replace, or for a new file the ones open(path, 'w') would have given it
+            try:
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+            except FileNotFoundError:
+                umask = os.umask(0)
+                os.umask(umask)
+                mode = 0o666 & ~umask
+            os.chmod(f.name, mode)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.replace(f.name, path)
 
 # CLI Interface
 @click.group()
+@click.option('--verbose', '-v', is_flag=True, help='Show detailed progress messages')
 @click.pass_context
-def cli(ctx):
+def cli(ctx, verbose):
     """APM (Android Package Manager) - Command-line package manager for Android FOSS apps"""
+    logging.basicConfig(format='%(message)s', level=logging.INFO if verbose else logging.WARNING)
     ctx.ensure_object(dict)
     ctx.obj['pm'] = AndroidPackageManager()
 
 @cli.command()
+@click.option('--debug', is_flag=True, help='Show per-package update details')
 @click.pass_context
-def update(ctx):
+def update(ctx, debug):
     """Update repository indices and device packages"""
+    ctx.obj['pm'].debug = debug
     ctx.obj['pm'].update_repositories()
 
 @cli.command()
@@ -914,10 +1456,11 @@ def install(ctx, package_id, device):
 @cli.command()
 @click.argument('package_list_file')
 @click.option('--device', help='Target device ID')
+@click.option('--sequential', is_flag=True, help='Install packages one at a time instead of in a single fdroidcl run')
 @click.pass_context
-def batch_install(ctx, package_list_file, device):
+def batch_install(ctx, package_list_file, device, sequential):
     """Install multiple packages from file"""
-    ctx.obj['pm'].batch_install(package_list_file, device)
+    ctx.obj['pm'].batch_install(package_list_file, device, sequential=sequential)
 
 @cli.command()
 @click.pass_context
@@ -932,8 +1475,10 @@ def devices(ctx):
         click.echo("No devices connected")
 
 @cli.command()
+@click.option('--limit', type=int, help='Show only the first N mappings')
+@click.option('--prefix', help='Only show mappings whose name starts with PREFIX')
 @click.pass_context
-def mappings(ctx):
+def mappings(ctx, limit, prefix):
     """List all package mappings"""
     mappings = ctx.obj['pm'].mappings
     
@@ -941,8 +1486,19 @@ def mappings(ctx):
         click.echo("No package mappings found")
         return
     
+    entries = mappings.items()
+    if prefix:
+        prefix = prefix.lower()
+        entries = [(name, value) for name, value in entries if name.lower().startswith(prefix)]
+    
+    # Only the first N are displayed, so avoid sorting everything
+    if limit is not None:
+        entries = heapq.nsmallest(limit, entries, key=lambda entry: entry[0])
+    else:
+        entries = sorted(entries)
+    
     click.echo("Package Mappings:")
-    for name, package_id in sorted(mappings.items()):
+    for name, package_id in entries:
         if isinstance(package_id, dict):
             real_id = package_id.get('package_id', package_id.get('id', str(package_id)))
             click.echo(f"  {name:<25} -> {real_id}")
@@ -955,27 +1511,15 @@ def mappings(ctx):
 @click.pass_context
 def add_mapping(ctx, friendly_name, package_id):
     """Add a new package mapping"""
-    mappings_path = os.path.expanduser("~/.config/apm/package_mappings.yaml")
-    
-    # Load existing mappings
-    if os.path.exists(mappings_path):
-        with open(mappings_path, 'r') as f:
-            mappings = yaml.safe_load(f)
-    else:
-        mappings = {"custom": {}}
-    
-    # Add new mapping to custom category
-    if "custom" not in mappings:
-        mappings["custom"] = {}
-    
-    mappings["custom"][friendly_name] = package_id
-    
-    # Save updated mappings
-    with open(mappings_path, 'w') as f:
-        yaml.dump(mappings, f, default_flow_style=False)
+    try:
+        added = ctx.obj['pm'].add_mapping(friendly_name, package_id)
+    except yaml.YAMLError as e:
+        click.echo(f"❌ Not changing the mappings file - it could not be parsed: {e}")
+        sys.exit(1)
     
-    # Reload mappings in current instance
-    ctx.obj['pm'].mappings = ctx.obj['pm'].load_mappings()
+    if not added:
+        click.echo(f"Mapping already exists: {friendly_name} -> {package_id}")
+        return
     
     click.echo(f"Added mapping: {friendly_name} -> {package_id}")
 
@@ -995,47 +1539,32 @@ def resolve(ctx, package_name):
 @click.pass_context
 def remove_mapping(ctx, friendly_name):
     """Remove a package mapping"""
-    mappings_path = os.path.expanduser("~/.config/apm/package_mappings.yaml")
-    
-    if not os.path.exists(mappings_path):
-        click.echo("No mappings file found")
-        return
-    
-    with open(mappings_path, 'r') as f:
-        mappings = yaml.safe_load(f)
+    pm = ctx.obj['pm']
     
-    # Find and remove the mapping
-    removed = False
-    for category, packages in mappings.items():
-        if isinstance(packages, dict) and friendly_name in packages:
-            del packages[friendly_name]
-            removed = True
-            click.echo(f"Removed mapping: {friendly_name}")
-            break
+    try:
+        if not pm.raw_mappings:
+            click.echo("No mappings file found")
+            return
+        
+        removed = pm.remove_mapping(friendly_name)
+    except yaml.YAMLError as e:
+        click.echo(f"❌ Not changing the mappings file - it could not be parsed: {e}")
+        sys.exit(1)
     
-    if not removed:
+    if removed:
+        click.echo(f"Removed mapping: {friendly_name}")
+    else:
         click.echo(f"Mapping '{friendly_name}' not found")
-        return
-    
-    # Save updated mappings
-    with open(mappings_path, 'w') as f:
-        yaml.dump(mappings, f, default_flow_style=False)
-    
-    # Reload mappings in current instance
-    ctx.obj['pm'].mappings = ctx.obj['pm'].load_mappings()
 
 @cli.command()
 @click.pass_context
 def list_categories(ctx):
     """List all available categories"""
-    mappings_path = os.path.expanduser("~/.config/apm/package_mappings.yaml")
-    
-    if not os.path.exists(mappings_path):
+    if not os.path.exists(MAPPINGS_PATH):
         click.echo("No mappings file found")
         return
     
-    with open(mappings_path, 'r') as f:
-        mappings = yaml.safe_load(f)
+    mappings = read_yaml(MAPPINGS_PATH)
     
     click.echo("Available Categories:")
     for category, packages in mappings.items():
@@ -1066,9 +1595,7 @@ def debug_mappings(ctx, package_name):
             click.echo(f"Direct match: {package_name} -> {value}")
         
         # Partial matches
-        matches = [name for name in pm.mappings.keys() 
-                  if isinstance(name, str) and isinstance(package_name, str) 
-                  and package_name.lower() in name.lower()]
+        matches = pm.find_partial_matches(package_name)
         
         if matches:
             click.echo(f"Partial matches ({len(matches)}):")
@@ -1099,21 +1626,24 @@ def repo_status(ctx):
     click.echo("Repository Status Check:")
     click.echo("=" * 60)
     
+    # Probe all enabled repositories at once, then report in config order
+    reachable = pm.test_repositories_connectivity(
+        [repo for repo in repositories if repo.get('enabled', True)])
+    
     for repo in repositories:
         repo_name = repo['name']
         repo_url = repo['url']
         enabled = repo.get('enabled', True)
         priority = repo.get('priority', 'N/A')
         
-        status_icon = "🔴 DISABLED" if not enabled else "🟡 CHECKING..."
+        if not enabled:
+            status_icon = "🔴 DISABLED"
+        elif reachable[repo_url]:
+            status_icon = "🟢 ONLINE"
+        else:
+            status_icon = "🔴 OFFLINE"
         click.echo(f"{repo_name:<25} {status_icon} (Priority: {priority})")
         
-        if enabled:
-            if pm.test_repository_connectivity(repo_url):
-                click.echo(f"{repo_name:<25} 🟢 ONLINE")
-            else:
-                click.echo(f"{repo_name:<25} 🔴 OFFLINE")
-        
         click.echo(f"{'  URL:':<25} {repo_url}")
         if 'description' in repo:
             click.echo(f"{'  Description:':<25} {repo['description']}")
@@ -3,97 +3,207 @@
 Automated package curation for FOSS Package Manager
 """
 
+import gzip
+import hashlib
 import json
+import os
+import sys
+import tempfile
+import time
 import yaml
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+# Prefer the libyaml-backed loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+# ijson lets us walk the (large) repository index without loading it whole
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+# orjson serializes the curated list much faster when it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Downloaded indexes, one directory per repository URL
+INDEX_CACHE_DIR = os.path.expanduser("~/.cache/apm/indices")
+
 class PackageCurator:
-    def __init__(self, config_path="curation_config.yaml"):
+    def __init__(self, config_path="curation_config.yaml", verbose=False):
         self.config = self.load_config(config_path)
+        self.verbose = verbose
+        # Lookup forms of the criteria, built once rather than per package
+        self._approved_licenses = tuple(l.lower() for l in self.config['approved_licenses'])
+        self._approved_categories = set(self.config['approved_categories'])
+        self._blocked_anti_features = set(self.config.get('blocked_anti_features', []))
+        self._min_added_timestamp = self.config.get('min_added_timestamp', 0)
+        # One pooled session so repeated index fetches reuse connections
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=16))
         self.approved_packages = set()
         self.rejected_packages = set()
         
     def load_config(self, path):
         """Load curation configuration"""
         with open(path, 'r') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
     
     def evaluate_package(self, package_data):
-        """Evaluate if package meets FOSS criteria"""
-        # Check license
-        license_name = package_data.get('license', '').lower()
-        approved_licenses = [l.lower() for l in self.config['approved_licenses']]
+        """Evaluate if package meets FOSS criteria - cheapest checks first"""
+        # Check minimum requirements
+        if package_data.get('added', 0) < self._min_added_timestamp:
+            return False, "Package too old"
         
-        if not any(license_name.startswith(al) for al in approved_licenses):
-            return False, f"License {license_name} not approved"
+        # Check for anti-features
+        anti_features = package_data.get('antiFeatures', [])
+        
+        if not self._blocked_anti_features.isdisjoint(anti_features):
+            return False, f"Contains blocked anti-features: {anti_features}"
         
         # Check categories
         categories = package_data.get('categories', [])
-        if not any(cat in self.config['approved_categories'] for cat in categories):
+        if self._approved_categories.isdisjoint(categories):
             return False, f"Categories {categories} not approved"
         
-        # Check for anti-features
-        anti_features = package_data.get('antiFeatures', [])
-        blocked_features = self.config.get('blocked_anti_features', [])
-        
-        if any(af in blocked_features for af in anti_features):
-            return False, f"Contains blocked anti-features: {anti_features}"
+        # Check license
+        license_name = package_data.get('license')
+        if not license_name:
+            return False, "No license specified"
         
-        # Check minimum requirements
-        if package_data.get('added', 0) < self.config.get('min_added_timestamp', 0):
-            return False, "Package too old"
+        license_name = license_name.lower()
+        if not license_name.startswith(self._approved_licenses):
+            return False, f"License {license_name} not approved"
         
         return True, "Package approved"
     
     def curate_repository(self, repo_url):
         """Curate packages from repository"""
-        index_url = f"{repo_url}/index-v1.json"
-        
         try:
-            response = requests.get(index_url)
-            response.raise_for_status()
-            index_data = response.json()
-            
-            apps = index_data.get('apps', {})
-            curated_apps = {}
-            
-            for app_id, app_data in apps.items():
+            index_path = self.fetch_index(repo_url)
+        except (requests.RequestException, OSError) as e:
+            print(f"Failed to fetch repository index: {e}")
+            return {}
+        
+        curated_apps = {}
+        rejected = 0
+        # Per-app verdicts are only kept in verbose mode and written in one go
+        lines = [] if self.verbose else None
+        
+        with gzip.open(index_path, 'rb') as f:
+            for app_id, app_data in self.iter_index_apps(f):
                 approved, reason = self.evaluate_package(app_data)
                 
                 if approved:
                     curated_apps[app_id] = app_data
                     self.approved_packages.add(app_id)
-                    print(f"✓ {app_id}: {reason}")
                 else:
+                    rejected += 1
                     self.rejected_packages.add(app_id)
-                    print(f"✗ {app_id}: {reason}")
+                if lines is not None:
+                    lines.append(f"{'✓' if approved else '✗'} {app_id}: {reason}")
+        
+        if lines:
+            sys.stdout.write('\n'.join(lines) + '\n')
+        print(f"{repo_url}: approved={len(curated_apps)} rejected={rejected}")
+        
+        return curated_apps
+    
+    def fetch_index(self, repo_url):
+        """Return the path of a gzipped local copy of the repository index,
+        downloading it only if the server reports a change since the last fetch"""
+        index_url = f"{repo_url}/index-v1.json"
+        cache_dir = os.path.join(INDEX_CACHE_DIR, hashlib.sha1(repo_url.encode()).hexdigest())
+        index_path = os.path.join(cache_dir, 'index.json.gz')
+        meta_path = os.path.join(cache_dir, 'meta.json')
+        
+        headers = {}
+        if os.path.exists(index_path):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                if meta.get('etag'):
+                    headers['If-None-Match'] = meta['etag']
+                if meta.get('last_modified'):
+                    headers['If-Modified-Since'] = meta['last_modified']
+            except (OSError, ValueError):
+                pass
+        
+        with self.session.get(index_url, headers=headers, stream=True) as response:
+            if response.status_code == 304:
+                return index_path
+            response.raise_for_status()
             
-            return curated_apps
+            # Stream the body into a temp file and swap it in once complete
+            os.makedirs(cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as f:
+                    for chunk in response.iter_content(chunk_size=1 << 16):
+                        f.write(chunk)
+                os.replace(tmp_path, index_path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
             
-        except requests.RequestException as e:
-            print(f"Failed to fetch repository index: {e}")
-            return {}
+            with open(meta_path, 'w') as f:
+                json.dump({'etag': response.headers.get('ETag'),
+                           'last_modified': response.headers.get('Last-Modified')}, f)
+        
+        return index_path
+    
+    def curate_repositories(self, repo_urls, max_workers=4):
+        """Curate several repositories concurrently and merge the approved apps"""
+        curated_apps = {}
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(repo_urls)))) as executor:
+            futures = {executor.submit(self.curate_repository, url): url for url in repo_urls}
+            # Merge in the calling thread as each download finishes
+            for future in as_completed(futures):
+                curated_apps.update(future.result())
+        
+        return curated_apps
+    
+    def iter_index_apps(self, f):
+        """Yield (app_id, app_data) pairs from an index file object"""
+        if ijson is None:
+            yield from json.load(f).get('apps', {}).items()
+            return
+        
+        yield from ijson.kvitems(f, 'apps')
     
     def generate_curated_list(self, output_file="curated_packages.json"):
         """Generate curated package list"""
         curated_data = {
-            'approved_packages': list(self.approved_packages),
-            'rejected_packages': list(self.rejected_packages),
+            'approved_packages': self.approved_packages,
+            'rejected_packages': self.rejected_packages,
             'curation_timestamp': int(time.time())
         }
         
-        with open(output_file, 'w') as f:
-            json.dump(curated_data, f, indent=2)
+        if orjson:
+            Path(output_file).write_bytes(
+                orjson.dumps(curated_data, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS, default=list))
+        else:
+            with open(output_file, 'w') as f:
+                json.dump(curated_data, f, indent=2, sort_keys=True, default=list)
         
         print(f"Curated {len(self.approved_packages)} packages")
         print(f"Rejected {len(self.rejected_packages)} packages")
 
 if __name__ == '__main__':
-    curator = PackageCurator()
+    curator = PackageCurator(verbose='-v' in sys.argv[1:])
     
-    # Curate main F-Droid repository
-    curator.curate_repository("https://f-droid.org/repo")
+    # Curate main F-Droid repository - add more URLs here to fetch them concurrently
+    curator.curate_repositories(["https://f-droid.org/repo"])
     
     # Generate output
     curator.generate_curated_list()
@@ -0,0 +1,298 @@
+import unittest
+import os
+import random
+import shutil
+import stat
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from unittest import mock
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import apm
+from apm import AdbShell, AndroidPackageManager
+
+# Stand-in adb: 'features' reports shell_v2 only for the v2 variant; 'shell -T'
+# is a plain sh, while the legacy shell echoes each input line like a device PTY
+FAKE_ADB = """#!/bin/sh
+if [ "$1" = features ]; then
+    {features}
+    exit 0
+fi
+if [ "$2" = -T ]; then
+    exec sh
+fi
+while IFS= read -r line; do
+    printf 'shell@device:/ $ %s\\r\\n' "$line"
+    sh -c "$line" | sed 's/$/\\r/'
+done
+"""
+
+class TestRunStreaming(unittest.TestCase):
+    def setUp(self):
+        self.pm = AndroidPackageManager()
+    
+    def test_output_tail_on_failure(self):
+        """Test that a failing command reports its last output lines"""
+        with self.assertRaises(subprocess.CalledProcessError) as cm:
+            self.pm.run_streaming(['sh', '-c', 'echo one; echo two; exit 3'], timeout=10, tail_lines=1)
+        self.assertEqual(cm.exception.returncode, 3)
+        self.assertEqual(cm.exception.output, 'two')
+    
+    def test_timeout_kills_grandchildren(self):
+        """Test that the timeout holds when a grandchild keeps the output pipe open"""
+        start = time.monotonic()
+        with self.assertRaises(subprocess.TimeoutExpired):
+            self.pm.run_streaming(['sh', '-c', 'echo a; sleep 10'], timeout=1)
+        self.assertLess(time.monotonic() - start, 5)
+
+class TestPartialMatches(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.mappings_path = os.path.join(self.temp_dir, 'package_mappings.yaml')
+        # Keep the tests away from the user's real mappings and cache
+        for name, value in (('MAPPINGS_PATH', self.mappings_path),
+                            ('MAPPINGS_CACHE_PATH', os.path.join(self.temp_dir, 'package_mappings.json'))):
+            patcher = mock.patch.object(apm, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.pm = AndroidPackageManager()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def naive_matches(self, query):
+        query = query.lower()
+        return [name for name in self.pm.mappings if query in name.lower()]
+    
+    def random_names(self, rng, count):
+        alphabet = 'abcdefgh-_.2Z'
+        return {''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))): f"org.example.app{i}"
+                for i in range(count)}
+    
+    def test_matches_naive_scan(self):
+        """Test every search strategy against a plain linear scan"""
+        rng = random.Random(1234)
+        self.pm.mappings = self.random_names(rng, 500)
+        alphabet = 'abcdefgh-_.2zZ'
+        queries = ['', 'Z', 'zz', 'abc', 'xyz', '\x1f']
+        queries += [''.join(rng.choice(alphabet) for _ in range(length))
+                    for length in (1, 2, 3, 4, 6) for _ in range(100)]
+        # Names that really exist, so long queries hit as well as miss
+        queries += [name[1:5].upper() for name in list(self.pm.mappings)[:100]]
+        for query in queries:
+            self.assertEqual(self.pm.find_partial_matches(query), self.naive_matches(query), repr(query))
+    
+    def test_non_string_query(self):
+        """Test that non-string queries match nothing"""
+        self.pm.mappings = {'firefox': 'org.mozilla.fennec_fdroid'}
+        self.assertEqual(self.pm.find_partial_matches(None), [])
+    
+    def test_edits_invalidate_indexes(self):
+        """Test that add_mapping/remove_mapping refresh the search indexes"""
+        with open(self.mappings_path, 'w') as f:
+            f.write("browsers:\n  firefox: org.mozilla.fennec_fdroid\n  fennec: org.mozilla.fennec\n")
+        
+        # Build all three strategies' state before editing
+        for query in ('f', 'fe', 'fen'):
+            self.pm.find_partial_matches(query)
+        self.assertEqual(self.pm.resolve_package_name('firefox'), 'org.mozilla.fennec_fdroid')
+        
+        self.assertTrue(self.pm.add_mapping('fennec-beta', 'org.example.beta'))
+        for query in ('n', 'en', 'fen', 'BETA'):
+            self.assertIn('fennec-beta', self.pm.find_partial_matches(query))
+            self.assertEqual(self.pm.find_partial_matches(query), self.naive_matches(query))
+        
+        self.assertTrue(self.pm.remove_mapping('firefox'))
+        for query in ('x', 'fi', 'fox'):
+            self.assertNotIn('firefox', self.pm.find_partial_matches(query))
+        # Unmapped names pass through unchanged - the memoized answer must not survive
+        self.assertEqual(self.pm.resolve_package_name('firefox'), 'firefox')
+        
+        # A fresh manager sees the saved edits
+        reloaded = AndroidPackageManager()
+        self.assertEqual(reloaded.find_partial_matches('fen'), ['fennec', 'fennec-beta'])
+
+    def test_edit_after_assigning_mappings(self):
+        """Test editing when mappings were assigned before anything was loaded"""
+        with open(self.mappings_path, 'w') as f:
+            f.write("browsers:\n  firefox: org.mozilla.fennec_fdroid\n")
+        self.pm.mappings = {'a': 'b.c'}
+        self.assertTrue(self.pm.add_mapping('x', 'y.z'))
+        self.assertEqual(apm.read_yaml(self.mappings_path),
+                         {'browsers': {'firefox': 'org.mozilla.fennec_fdroid'}, 'custom': {'x': 'y.z'}})
+
+    def test_edit_refuses_malformed_file(self):
+        """Test that a mappings file that fails to parse is never overwritten"""
+        original = "browsers:\n  firefox: [org.mozilla.fennec_fdroid\n"
+        with open(self.mappings_path, 'w') as f:
+            f.write(original)
+        
+        self.assertEqual(self.pm.mappings, {})
+        with self.assertRaises(apm.yaml.YAMLError):
+            self.pm.add_mapping('foo', 'com.foo')
+        with self.assertRaises(apm.yaml.YAMLError):
+            self.pm.remove_mapping('firefox')
+        with open(self.mappings_path) as f:
+            self.assertEqual(f.read(), original)
+    
+    def test_add_to_missing_file(self):
+        """Test that add_mapping starts a new file when there is none"""
+        self.assertEqual(self.pm.mappings, {})
+        self.assertTrue(self.pm.add_mapping('foo', 'com.foo'))
+        self.assertEqual(apm.read_yaml(self.mappings_path), {'custom': {'foo': 'com.foo'}})
+
+    def test_edit_non_string_names(self):
+        """Test that a bare numeric name in the file is edited as the same string name"""
+        with open(self.mappings_path, 'w') as f:
+            f.write("games:\n  2048: com.uberspot.a2048\n")
+        self.assertEqual(self.pm.resolve_package_name('2048'), 'com.uberspot.a2048')
+        
+        self.assertFalse(self.pm.add_mapping('2048', 'com.uberspot.a2048'))
+        self.assertTrue(self.pm.remove_mapping('2048'))
+        self.assertEqual(apm.read_yaml(self.mappings_path), {'games': {}})
+        
+        self.assertTrue(self.pm.add_mapping('2048', 'com.other'))
+        self.assertTrue(self.pm.add_mapping('2048', 'com.third'))
+        self.assertEqual(apm.read_yaml(self.mappings_path), {'games': {}, 'custom': {'2048': 'com.third'}})
+    
+    def test_add_existing_name_updates_in_place(self):
+        """Test that re-adding a name changes its entry instead of adding a second one"""
+        with open(self.mappings_path, 'w') as f:
+            f.write("games:\n  2048: com.uberspot.a2048\n  chess: org.chess\nnotes: org.notes\n")
+        self.assertTrue(self.pm.add_mapping('2048', 'com.other'))
+        self.assertTrue(self.pm.add_mapping('notes', 'org.other.notes'))
+        self.assertEqual(apm.read_yaml(self.mappings_path),
+                         {'games': {2048: 'com.other', 'chess': 'org.chess'}, 'notes': 'org.other.notes'})
+        self.assertEqual(self.pm.resolve_package_name('2048'), 'com.other')
+
+class TestBatchInstall(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        for name in ('CONFIG_PATH', 'MAPPINGS_PATH', 'MAPPINGS_CACHE_PATH'):
+            patcher = mock.patch.object(apm, name, os.path.join(self.temp_dir, name.lower()))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        # fdroidcl stand-in: the bulk run fails, single-package runs succeed
+        bin_dir = os.path.join(self.temp_dir, 'bin')
+        os.mkdir(bin_dir)
+        fdroidcl = os.path.join(bin_dir, 'fdroidcl')
+        with open(fdroidcl, 'w') as f:
+            f.write('#!/bin/sh\n[ $# -le 2 ]\n')
+        os.chmod(fdroidcl, stat.S_IRWXU)
+        patcher = mock.patch.dict(os.environ, {'PATH': bin_dir + os.pathsep + os.environ['PATH']})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.list_path = os.path.join(self.temp_dir, 'packages.txt')
+        with open(self.list_path, 'w') as f:
+            f.write("org.example.one\norg.example.two\n")
+        self.config_path = os.path.join(self.temp_dir, 'config.yaml')
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def run_batch(self):
+        pm = AndroidPackageManager(self.config_path)
+        with mock.patch('click.echo') as echo:
+            pm.batch_install(self.list_path)
+        return [call.args[0] for call in echo.call_args_list]
+    
+    def test_retry_without_config(self):
+        """Test that the per-package retry doesn't need a config file"""
+        output = self.run_batch()
+        self.assertIn("Successfully installed org.example.one", output)
+        self.assertIn("Successfully installed org.example.two", output)
+    
+    def test_retry_with_zero_workers(self):
+        """Test that max_concurrent_updates: 0 still retries with one worker"""
+        with open(self.config_path, 'w') as f:
+            f.write("updates:\n  max_concurrent_updates: 0\n")
+        output = self.run_batch()
+        self.assertIn("Successfully installed org.example.two", output)
+
+class TestVersionComparison(unittest.TestCase):
+    def setUp(self):
+        self.pm = AndroidPackageManager()
+    
+    def test_compare_numeric(self):
+        """Test the numeric fast path, including padding with zeros"""
+        self.assertTrue(self.pm.compare_versions_semantic('1.10', '1.9'))
+        self.assertFalse(self.pm.compare_versions_semantic('1.0.0', '1'))
+        self.assertFalse(self.pm.compare_versions_semantic('1.2', '1.2.1'))
+    
+    def test_compare_non_ascii_digits(self):
+        """Test that digit-like characters int() rejects don't raise"""
+        self.assertFalse(self.pm.compare_versions_semantic('1.\u00b2', '1.0'))
+    
+    def test_newer_major_short_circuit(self):
+        """Test the major-version short-circuit, including digit-like majors"""
+        self.assertTrue(self.pm.is_version_newer('10.0', '9.5'))
+        self.assertFalse(self.pm.is_version_newer('2.0', '10.1'))
+        self.pm.is_version_newer('\u00b2.0', '1.0')  # must not raise
+
+class TestWriteYamlAtomic(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'mappings.yaml')
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def test_new_file_uses_umask(self):
+        """Test that a new file gets the umask default, not the temp file's 0600"""
+        old_umask = os.umask(0o022)
+        try:
+            apm.write_yaml_atomic(self.path, {'custom': {'app': 'org.example.app'}})
+        finally:
+            os.umask(old_umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o644)
+        self.assertEqual(apm.read_yaml(self.path), {'custom': {'app': 'org.example.app'}})
+    
+    def test_existing_mode_kept(self):
+        """Test that replacing a file keeps its permissions and leaves no temp files"""
+        with open(self.path, 'w') as f:
+            f.write("old: value\n")
+        os.chmod(self.path, 0o640)
+        apm.write_yaml_atomic(self.path, {2048: 'com.uberspot.a2048'})
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o640)
+        self.assertEqual(apm.read_yaml(self.path), {2048: 'com.uberspot.a2048'})
+        self.assertEqual(os.listdir(self.temp_dir), ['mappings.yaml'])
+
+class TestAdbShell(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def make_adb(self, features):
+        path = os.path.join(self.temp_dir, 'adb')
+        with open(path, 'w') as f:
+            f.write(FAKE_ADB.format(features=features))
+        os.chmod(path, stat.S_IRWXU)
+        return path
+    
+    def check_session(self, adb_path):
+        shell = AdbShell(adb_path)
+        try:
+            # Each answer must belong to its own command, not the one before
+            for version in ('1.0', '2.0', '3.0'):
+                self.assertEqual(shell.run(f"echo versionName={version} || true"), f"versionName={version}")
+            self.assertEqual(shell.run("printf partial"), "partial")
+        finally:
+            shell.close()
+    
+    def test_shell_v2(self):
+        """Test a session on a device with shell_v2 (no PTY)"""
+        self.check_session(self.make_adb("echo 'shell_v2 cmd stat_v2'"))
+    
+    def test_echoing_pty(self):
+        """Test that input echoed by a legacy device PTY isn't mistaken for output"""
+        self.check_session(self.make_adb("true"))
+
+if __name__ == '__main__':
+    unittest.main()
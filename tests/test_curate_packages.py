@@ -0,0 +1,123 @@
+import unittest
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+import sys
+
+import requests
+
+# Add scripts directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
+
+import curate_packages
+from curate_packages import PackageCurator
+
+CONFIG_PATH = str(Path(__file__).parent.parent / '.config' / 'curation_config.yaml')
+
+INDEX = {'apps': {
+    'org.example.good': {'license': 'GPL-3.0-only', 'categories': ['Internet'], 'added': 10 ** 13},
+    'org.example.bad': {'license': 'Proprietary', 'categories': ['Internet'], 'added': 10 ** 13},
+}}
+
+class TestEvaluatePackage(unittest.TestCase):
+    def setUp(self):
+        self.curator = PackageCurator(CONFIG_PATH)
+    
+    def test_reasons(self):
+        """Test the verdict and reason for each check"""
+        base = {'license': 'GPL-3.0-only', 'categories': ['Internet'], 'added': 10 ** 13}
+        cases = [
+            ({}, (True, "Package approved")),
+            ({'added': 0}, (False, "Package too old")),
+            ({'antiFeatures': ['Ads']}, (False, "Contains blocked anti-features: ['Ads']")),
+            ({'categories': ['Nope']}, (False, "Categories ['Nope'] not approved")),
+            ({'license': 'Proprietary'}, (False, "License proprietary not approved")),
+            ({'license': ''}, (False, "No license specified")),
+        ]
+        for overrides, expected in cases:
+            self.assertEqual(self.curator.evaluate_package({**base, **overrides}), expected, overrides)
+        
+        del base['license']
+        self.assertEqual(self.curator.evaluate_package(base), (False, "No license specified"))
+
+class FakeResponse:
+    """Just enough of requests.Response for fetch_index"""
+    def __init__(self, status_code, body=b'', headers=None, fail_after=None):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.fail_after = fail_after
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+    
+    def iter_content(self, chunk_size=1):
+        for offset in range(0, len(self.body), 16):
+            if self.fail_after is not None and offset >= self.fail_after:
+                raise requests.ConnectionError("connection reset")
+            yield self.body[offset:offset + 16]
+
+class TestFetchIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(curate_packages, 'INDEX_CACHE_DIR', self.temp_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.curator = PackageCurator(CONFIG_PATH)
+        self.curator.session = mock.Mock()
+        self.body = json.dumps(INDEX).encode()
+    
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+    
+    def cache_files(self):
+        return sorted(name for _, _, files in os.walk(self.temp_dir) for name in files)
+    
+    def test_not_modified_reuses_cache(self):
+        """Test 200 -> cached copy, then 304 -> the same copy is parsed again"""
+        self.curator.session.get.return_value = FakeResponse(200, self.body, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+        first = self.curator.curate_repository('https://repo.example/fdroid/repo')
+        self.assertEqual(list(first), ['org.example.good'])
+        self.assertEqual(self.cache_files(), ['index.json.gz', 'meta.json'])
+        self.assertEqual(self.curator.session.get.call_args.kwargs['headers'], {})
+        
+        self.curator.session.get.return_value = FakeResponse(304)
+        second = self.curator.curate_repository('https://repo.example/fdroid/repo')
+        self.assertEqual(second, first)
+        self.assertEqual(self.curator.session.get.call_args.kwargs['headers'],
+                         {'If-None-Match': '"v1"', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+    
+    def test_failed_download_keeps_previous_copy(self):
+        """Test that an interrupted download leaves no temp file and the old index in place"""
+        self.curator.session.get.return_value = FakeResponse(200, self.body, {'ETag': '"v1"'})
+        index_path = self.curator.fetch_index('https://repo.example/fdroid/repo')
+        
+        self.curator.session.get.return_value = FakeResponse(200, b'{"apps": {}}' * 10, {'ETag': '"v2"'}, fail_after=32)
+        with self.assertRaises(requests.ConnectionError):
+            self.curator.fetch_index('https://repo.example/fdroid/repo')
+        self.assertEqual(self.cache_files(), ['index.json.gz', 'meta.json'])
+        with gzip.open(index_path) as f:
+            self.assertEqual(json.load(f), INDEX)
+        
+        # curate_repository reports the failure rather than raising
+        self.assertEqual(self.curator.curate_repository('https://repo.example/fdroid/repo'), {})
+    
+    def test_http_error(self):
+        """Test that an HTTP error is reported as an empty curation"""
+        self.curator.session.get.return_value = FakeResponse(404)
+        self.assertEqual(self.curator.curate_repository('https://repo.example/fdroid/repo'), {})
+        self.assertEqual(self.cache_files(), [])
+
+if __name__ == '__main__':
+    unittest.main()